@@ -0,0 +1,267 @@
+# Per-row bundle construction, kept free of CLI/IO concerns so it can be
+# compiled with Cython (setup.py build_ext --inplace). The compiled
+# extension shadows this file when present; otherwise the interpreter
+# runs it as-is.
+
+import os
+import uuid
+
+PATIENT_ID_SYSTEM = "https://www.gmds.de/pk-nachwuchs/patient"
+STUDY_PATIENT_ID_SYSTEM = "https://www.cbioportal.org/patient"
+STUDY_ID_SYSTEM = "https://www.cbioportal.org/study"
+STUDY_ID_VALUE = "paad_tcga_pan_can_atlas_2018"
+
+# Row-invariant building blocks, shared by identity across all bundles.
+# They are never mutated, so reusing them per row is safe.
+_CONDITION_CLINICAL_STATUS = {
+    "coding": [
+        {
+            "system": "http://terminology.hl7.org/CodeSystem/condition-clinical",
+            "display": "Active",
+            "code": "active",
+        }
+    ]
+}
+_RADIATION_CODING = {
+    "system": "http://snomed.info/sct",
+    "code": "1287742003",
+    "display": "Radiotherapy (procedure)",
+}
+_COND_CODING_TEMPLATE = {"system": "http://fhir.de/CodeSystem/bfarm/icd-10-gm"}
+
+_LIVING_MAP = {"0:LIVING": True, "1:DECEASED": False}
+_YESNO = {"Yes": True, "No": False}
+
+_PAT_IF_NONE_EXIST = "identifier=" + PATIENT_ID_SYSTEM + "|"
+_RS_IF_NONE_EXIST = "identifier=" + STUDY_PATIENT_ID_SYSTEM + "|"
+
+# Set once per run (per worker process) via _set_research_study_id.
+STUDY_REF = None
+
+
+def _set_research_study_id(study_id):
+    global research_study_id, STUDY_REF
+    research_study_id = study_id
+    STUDY_REF = {"reference": f"ResearchStudy/{study_id}"}
+
+
+def _uuid_source(chunk=4096):
+    # Draw entropy in large chunks instead of one urandom read per uuid4().
+    while True:
+        buf = os.urandom(chunk)
+        for i in range(0, chunk, 16):
+            yield str(uuid.UUID(bytes=buf[i:i + 16], version=4))
+
+
+_uuids = _uuid_source()
+
+# TSV columns consumed per row: study subject id, diagnosis age, ICD-10
+# code, overall survival status, patient id, radiation therapy, sex.
+_FIELD_INDICES = (1, 3, 24, 35, 36, 46, 50)
+
+
+def pick_fields(line, indices=_FIELD_INDICES):
+    # Walk the line once and slice out only the wanted columns instead of
+    # materializing all ~50 of them with str.split.
+    fields = []
+    start = 0
+    col = 0
+    for target in indices:
+        while col < target:
+            start = line.index("\t", start) + 1
+            col += 1
+        end = line.find("\t", start)
+        if end == -1:
+            fields.append(line[start:].rstrip("\n"))
+        else:
+            fields.append(line[start:end])
+    return tuple(fields)
+
+
+def create_research_study():
+    return {
+        "resourceType": "ResearchStudy",
+        "id": research_study_id,
+        "identifier": [
+            {
+                "system": STUDY_ID_SYSTEM,
+                "value": "paad_tcga_pan_can_atlas_2018",
+            }
+        ],
+        "name": "tcga_pancreatic_adenocarcinoma",
+        "title": "Pancreatic Adenocarcinoma (TCGA, PanCancer Atlas)",
+        "version": "1.0.0",
+        "status": "active",
+        "progressStatus": [
+            {
+                "state": {
+                    "coding": [
+                        {
+                            "system": "http://hl7.org/fhir/research-study-status",
+                            "code": "completed",
+                            "display": "Completed",
+                        }
+                    ]
+                }
+            }
+        ],
+    }
+
+
+def create_patient(patient_id, gender, living_status, pat_uuid):
+    pat = {
+        "resourceType": "Patient",
+        "id": pat_uuid,
+        "identifier": [
+            {
+                "system": PATIENT_ID_SYSTEM,
+                "value": patient_id,
+            }
+        ],
+        "gender": gender.lower(),
+        "deceasedBoolean": living_status,
+    }
+    return pat
+
+
+def create_research_subject(study_patient_id, pat_uuid, rs_uuid):
+    research_sub = {
+        "resourceType": "ResearchSubject",
+        "id": rs_uuid,
+        "identifier": [
+            {
+                "system": STUDY_PATIENT_ID_SYSTEM,
+                "value": study_patient_id,
+            }
+        ],
+        "status": "active",
+        "subject": {"reference": "Patient/" + pat_uuid},
+        "study": STUDY_REF,
+    }
+    return research_sub
+
+
+_ICD10_LABELS = {
+    "C25.0": "Bösartige Neubildung: Pankreaskopf",
+    "C25.1": "Bösartige Neubildung: Pankreaskörper",
+    "C25.2": "Bösartige Neubildung: Pankreasschwanz",
+    "C25.3": "Bösartige Neubildung: Ductus pancreaticus",
+    "C25.4": "Bösartige Neubildung: Endokriner Drüsenanteil des Pankreas",
+    "C25.7": "Bösartige Neubildung: Sonstige Teile des Pankreas",
+    "C25.8": "Bösartige Neubildung: Pankreas, mehrere Teilbereiche überlappend",
+    "C25.9": "Bösartige Neubildung: Pankreas, nicht näher bezeichnet",
+}
+
+
+def get_label(icd_10_code):
+    return _ICD10_LABELS.get(icd_10_code)
+
+
+def create_condition(pat_uuid, icd_code, onset_age, cond_uuid):
+    condition = {
+        "resourceType": "Condition",
+        "id": cond_uuid,
+        "clinicalStatus": _CONDITION_CLINICAL_STATUS,
+        "code": {
+            "coding": [
+                {
+                    **_COND_CODING_TEMPLATE,
+                    "code": icd_code,
+                    "display": _ICD10_LABELS.get(icd_code),
+                }
+            ]
+        },
+        "subject": {"reference": "Patient/" + pat_uuid},
+        "onsetAge": {
+            "value": float(onset_age),
+            "unit": "a",  # UCUM unit for year
+        },
+    }
+    return condition
+
+
+def create_procedure(pat_uuid, proc_uuid):
+    procedure = {
+        "resourceType": "Procedure",
+        "id": proc_uuid,
+        "status": "completed",
+        "code": {"coding": [_RADIATION_CODING]},
+        "subject": {"reference": "Patient/" + pat_uuid},
+    }
+    return procedure
+
+
+def create_bundle(data_values):
+    (
+        study_subject_id,
+        onset_age,
+        icd_10_code,
+        living_status,
+        secondary_pat_id,
+        radiation,
+        gender,
+    ) = data_values
+    is_alive = _LIVING_MAP.get(living_status, False)
+    radio_therapy = _YESNO.get(radiation, False)
+
+    sec_pat_id_lower = secondary_pat_id.lower()
+
+    pat_uuid = next(_uuids)
+    rs_uuid = next(_uuids)
+    cond_uuid = next(_uuids)
+
+    pat = create_patient(
+        patient_id=sec_pat_id_lower,
+        gender=gender,
+        living_status=is_alive,
+        pat_uuid=pat_uuid,
+    )
+    research_subject = create_research_subject(
+        study_patient_id=study_subject_id, pat_uuid=pat_uuid, rs_uuid=rs_uuid
+    )
+    condition = create_condition(pat_uuid, icd_10_code, onset_age, cond_uuid)
+
+    entries = [
+        {
+            "fullUrl": "Patient/" + pat_uuid,
+            "resource": pat,
+            "request": {
+                "url": "Patient",
+                "method": "POST",
+                "ifNoneExist": _PAT_IF_NONE_EXIST + sec_pat_id_lower,
+            },
+        },
+        {
+            "fullUrl": "ResearchSubject/" + rs_uuid,
+            "resource": research_subject,
+            "request": {
+                "url": "ResearchSubject",
+                "method": "POST",
+                "ifNoneExist": _RS_IF_NONE_EXIST + study_subject_id,
+            },
+        },
+        {
+            "fullUrl": "Condition/" + cond_uuid,
+            "resource": condition,
+            "request": {"url": "Condition", "method": "POST"},
+        },
+    ]
+
+    if radio_therapy:
+        proc_uuid = next(_uuids)
+        procedure = create_procedure(pat_uuid=pat_uuid, proc_uuid=proc_uuid)
+        entries.append(
+            {
+                "fullUrl": "Procedure/" + proc_uuid,
+                "resource": procedure,
+                "request": {"url": "Procedure", "method": "POST"},
+            }
+        )
+
+    transaction_bundle = {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": entries,
+    }
+
+    return transaction_bundle, study_subject_id
@@ -0,0 +1,7 @@
+from Cython.Build import cythonize
+from setuptools import setup
+
+setup(
+    name="tcga-fhir",
+    ext_modules=cythonize("converter_core.py", language_level=3),
+)